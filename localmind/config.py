@@ -7,6 +7,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = Path(os.environ.get("LOCALMIND_DATA_DIR", str(BASE_DIR / "data")))
 CHROMA_PATH = Path(os.environ.get("LOCALMIND_CHROMA_PATH", str(DATA_DIR / "chroma")))
 DOCUMENTS_DIR = Path(os.environ.get("LOCALMIND_DOCUMENTS_DIR", str(DATA_DIR / "documents")))
+PDF_CACHE_DIR = Path(os.environ.get("LOCALMIND_PDF_CACHE_DIR", str(DATA_DIR / "pdf_cache")))
 
 # Models
 EMBEDDING_MODEL = os.environ.get("LOCALMIND_EMBEDDING_MODEL", "nomic-embed-text")
@@ -15,6 +16,16 @@ CHAT_MODEL = os.environ.get("LOCALMIND_CHAT_MODEL", "llama3.1:8b")
 # Ollama
 OLLAMA_BASE_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 
+# Embeddings (texts per /api/embed request, and how many requests may be in flight)
+EMBED_BATCH = int(os.environ.get("LOCALMIND_EMBED_BATCH", "32"))
+EMBED_CONCURRENCY = int(os.environ.get("LOCALMIND_EMBED_CONCURRENCY", "4"))
+
+# Chunks written to ChromaDB per upsert call during ingest
+ADD_BATCH = int(os.environ.get("LOCALMIND_ADD_BATCH", "2048"))
+
+# PDF text extraction: "pymupdf" (fast, AGPL) or "pypdf" (pure Python, BSD)
+PDF_BACKEND = os.environ.get("LOCALMIND_PDF_BACKEND", "pymupdf").lower()
+
 # Chunking
 CHUNK_SIZE = int(os.environ.get("LOCALMIND_CHUNK_SIZE", "1024"))
 CHUNK_OVERLAP = int(os.environ.get("LOCALMIND_CHUNK_OVERLAP", "200"))
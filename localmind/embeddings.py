@@ -0,0 +1,120 @@
+"""Batched Ollama embeddings (/api/embed); vectors are passed to ChromaDB explicitly on add and query."""
+import functools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+
+from localmind.config import (
+    EMBED_BATCH,
+    EMBED_CONCURRENCY,
+    EMBEDDING_MODEL,
+    OLLAMA_BASE_URL,
+)
+
+# Retry transient Ollama failures (overloaded / restarting) with jittered exponential backoff
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_MAX_ATTEMPTS = 4
+_BACKOFF_BASE = 0.5
+
+
+class OllamaBatchEmbeddingFunction:
+    """
+    Embed documents with Ollama's /api/embed, sending up to `batch_size` texts per request
+    and keeping up to `concurrency` requests in flight.
+    Falls back to the legacy one-prompt-per-request /api/embeddings on servers without /api/embed.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        base_url: str = OLLAMA_BASE_URL,
+        batch_size: int = EMBED_BATCH,
+        concurrency: int = EMBED_CONCURRENCY,
+        timeout: float = 120.0,
+    ) -> None:
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        # One keep-alive connection pool (thread-safe) for every request made by this function
+        self._client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=self.concurrency),
+        )
+
+    def __call__(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_array(list(texts)).tolist()
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts into a (len(texts), dim) float32 matrix.
+        4 bytes per value instead of a Python float object per value keeps large ingests compact.
+        """
+        batches = [(i, texts[i : i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        if len(batches) <= 1 or self.concurrency == 1:
+            return self._fill(len(texts), ((offset, self._embed_batch(batch)) for offset, batch in batches))
+
+        # Sub-batches finish out of order; each is written into its own rows so output order matches input
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            futures = [(offset, pool.submit(self._embed_batch, batch)) for offset, batch in batches]
+            return self._fill(len(texts), ((offset, future.result()) for offset, future in futures))
+
+    @staticmethod
+    def _fill(total: int, results) -> np.ndarray:
+        """
+        Write (offset, vectors) sub-batch results into one pre-sized matrix of unit-length rows.
+        /api/embed returns normalized vectors but /api/embeddings does not; normalizing both keeps
+        L2 distances in the index comparable whichever endpoint produced a vector.
+        """
+        matrix = None
+        for offset, vecs in results:
+            if matrix is None:
+                matrix = np.empty((total, vecs.shape[1]), dtype=np.float32)
+            matrix[offset : offset + len(vecs)] = vecs
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return matrix
+
+    def _post(self, path: str, payload: dict) -> httpx.Response:
+        """POST to Ollama, retrying 429/5xx responses with jittered exponential backoff."""
+        for attempt in range(_MAX_ATTEMPTS):
+            resp = self._client.post(self.base_url + path, json=payload)
+            if resp.status_code not in _RETRY_STATUSES or attempt == _MAX_ATTEMPTS - 1:
+                return resp
+            time.sleep(_BACKOFF_BASE * 2**attempt + random.uniform(0, _BACKOFF_BASE))
+        return resp
+
+    def _embed_batch(self, batch: list[str]) -> np.ndarray:
+        """Embed one sub-batch with a single /api/embed call."""
+        resp = self._post("/api/embed", {"model": self.model_name, "input": batch})
+        if resp.status_code != 404:
+            resp.raise_for_status()
+            data = resp.json()
+            if "embeddings" in data:
+                return np.asarray(data["embeddings"], dtype=np.float32)
+        return self._embed_legacy(batch)
+
+    def _embed_legacy(self, batch: list[str]) -> np.ndarray:
+        """Older Ollama servers: one /api/embeddings call per text."""
+        out = []
+        for text in batch:
+            resp = self._post("/api/embeddings", {"model": self.model_name, "prompt": text})
+            resp.raise_for_status()
+            out.append(resp.json()["embedding"])
+        return np.asarray(out, dtype=np.float32)
+
+
+@functools.lru_cache(maxsize=1)
+def get_embedding_function() -> OllamaBatchEmbeddingFunction:
+    """Shared embedding function (and its connection pool) for the whole process."""
+    return OllamaBatchEmbeddingFunction()
+
+
+def embed(texts: list[str]) -> np.ndarray:
+    """Embed texts outside of ChromaDB so we control batch size and concurrency; returns float32 rows."""
+    return get_embedding_function().embed_array(texts)
@@ -1,146 +1,455 @@
 """Document ingestion: load PDFs/text, chunk, embed via Ollama, store in ChromaDB."""
-import re
+import functools
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
 from pathlib import Path
 
 import chromadb
-from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
-from pypdf import PdfReader
+import numpy as np
 
 from localmind.config import (
+    ADD_BATCH,
     CHROMA_PATH,
     CHUNK_OVERLAP,
     CHUNK_SIZE,
     COLLECTION_NAME,
-    EMBEDDING_MODEL,
-    OLLAMA_BASE_URL,
+    PDF_BACKEND,
+    PDF_CACHE_DIR,
 )
+from localmind.embeddings import embed
+from localmind.rag import SOURCES_SEP, bump_collection_version
+
+_SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+# Extraction workers must not be forked from a process that already runs threads (Streamlit's
+# server, chromadb, httpx): fork after threads can deadlock, so start them from a clean process
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# Files queued per extraction worker: keeps workers busy without buffering the whole corpus
+_JOBS_PER_WORKER = 2
+
+
+def _pack(parts: list[str], sep: str, chunk_size: int, overlap: int) -> tuple[list[str], set[int]]:
+    """
+    Greedily pack parts (re-joined with sep) into chunks of at most chunk_size, carrying an
+    overlap tail into each next chunk. A part too big on its own is kept in place, unstripped;
+    returns (chunks, indices of those too-big leftovers).
+    """
+    chunks: list[str] = []
+    leftovers: set[int] = set()
+    # Buffer parts and join once per emitted chunk (avoids quadratic `str +=`)
+    current_parts: list[str] = []
+    current_len = 0
+
+    def flush() -> str:
+        joined = "".join(current_parts)
+        if joined.strip():
+            chunks.append(joined.strip())
+        return joined
+
+    last = len(parts) - 1
+    for i, part in enumerate(parts):
+        add = part + sep if i < last else part
+        if len(add) > chunk_size:
+            flush()
+            leftovers.add(len(chunks))
+            chunks.append(add)
+            current_parts, current_len = [], 0
+        elif current_len + len(add) <= chunk_size:
+            current_parts.append(add)
+            current_len += len(add)
+        else:
+            joined = flush()
+            # start next chunk with overlap (tail keeps its separator so words don't merge)
+            tail = joined[-overlap:] if overlap > 0 else ""
+            if tail and len(tail) + len(add) <= chunk_size:
+                current_parts, current_len = [tail, add], len(tail) + len(add)
+            else:
+                current_parts, current_len = [add], len(add)
+    flush()
+    return chunks, leftovers
+
+
+def _recursive_split(text: str, seps_idx: int, chunk_size: int, overlap: int) -> list[str]:
+    """Chunk text with _SEPARATORS[seps_idx:], descending only into pieces that are still too big."""
+    if len(text) <= chunk_size or seps_idx >= len(_SEPARATORS):
+        return [text.strip()] if text.strip() else []
+    # A separator that does not occur would just hand back the whole text; skip straight past it
+    while seps_idx < len(_SEPARATORS) - 1 and _SEPARATORS[seps_idx] not in text:
+        seps_idx += 1
+    sep = _SEPARATORS[seps_idx]
+    # Whitespace level: str.split() splits on runs of any whitespace in C; tokens are rejoined with " "
+    parts = text.split() if sep == " " else text.split(sep)
+    chunks, leftovers = _pack(parts, sep, chunk_size, overlap)
+    if not leftovers:
+        return chunks
+    out: list[str] = []
+    for i, chunk in enumerate(chunks):
+        if i in leftovers:
+            out.extend(_recursive_split(chunk, seps_idx + 1, chunk_size, overlap))
+        else:
+            out.append(chunk)
+    return out
 
 
 def _chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
-    """Split text into overlapping chunks (recursive-style: try paragraph, then line, then space)."""
+    """
+    Split text into overlapping chunks (recursive-style: try paragraph, then line, then sentence,
+    then space). Only pieces that are still larger than chunk_size are split further.
+    """
     if not text or not text.strip():
         return []
-    separators = ["\n\n", "\n", ". ", " "]
-    chunks = [text]
-    for sep in separators:
-        new_chunks = []
-        for c in chunks:
-            if len(c) <= chunk_size:
-                new_chunks.append(c)
-                continue
-            parts = c.split(sep) if sep != " " else re.split(r"\s+", c)
-            current = ""
-            for i, part in enumerate(parts):
-                add = part if sep == " " else (part + (sep if i < len(parts) - 1 else ""))
-                if len(current) + len(add) <= chunk_size:
-                    current += add
-                else:
-                    if current:
-                        new_chunks.append(current.strip())
-                    # start next chunk with overlap
-                    overlap_start = "" if overlap <= 0 else current[-overlap:] if len(current) >= overlap else current
-                    current = overlap_start + add
-            if current.strip():
-                new_chunks.append(current.strip())
-        chunks = new_chunks
-    return [c for c in chunks if c.strip()]
-
-
-def load_pdf(path: Path) -> list[tuple[str, dict]]:
-    """Load a PDF file; return list of (page_text, {source, page})."""
+    return _recursive_split(text, 0, chunk_size, overlap)
+
+
+def _iter_pages_pymupdf(path: Path) -> Iterator[str]:
+    """Yield the text of every page with PyMuPDF (MuPDF C library)."""
+    import pymupdf
+
+    with pymupdf.open(str(path)) as doc:
+        for page in doc:
+            yield page.get_text("text")
+
+
+def _iter_pages_pypdf(path: Path) -> Iterator[str]:
+    """Yield the text of every page with pypdf (pure Python fallback)."""
+    from pypdf import PdfReader
+
     reader = PdfReader(str(path))
-    out = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _file_digest(path: Path) -> str:
+    """Content hash of a file, read in blocks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_pdf_cache(digest: str, size: int) -> list[str]:
+    """Page texts cached on disk for a PDF digest. Raises OSError/ValueError when the entry is missing or stale."""
+    data = json.loads((PDF_CACHE_DIR / f"{digest}.json").read_text(encoding="utf-8"))
+    if data.get("size") != size or data.get("backend") != PDF_BACKEND:
+        raise ValueError(f"Stale PDF cache entry: {digest}")
+    return data["pages"]
+
+
+def _write_through_pdf_cache(digest: str, size: int, pages: Iterator[str]) -> Iterator[str]:
+    """
+    Yield pages while streaming them into the cache file for digest, so the whole document is
+    never held in memory. The entry is published only once every page was written; caching is
+    best effort (e.g. read-only data dir).
+    """
+    target = PDF_CACHE_DIR / f"{digest}.json"
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        f = open(tmp, "w", encoding="utf-8")
+    except OSError:
+        yield from pages
+        return
+    try:
+        with f:
+            f.write(json.dumps({"size": size, "backend": PDF_BACKEND})[:-1] + ', "pages": [')
+            for i, text in enumerate(pages):
+                f.write(("," if i else "") + json.dumps(text))
+                yield text
+            f.write("]}")
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def load_pdf(path: Path) -> Iterator[tuple[str, dict]]:
+    """
+    Load a PDF file with the configured backend; yield (page_text, {source, page}) page by page.
+    Extracted text is cached in PDF_CACHE_DIR by content hash, so re-ingesting is cheap.
+    """
+    size = path.stat().st_size
+    digest = _file_digest(path)
+    try:
+        pages = _read_pdf_cache(digest, size)
+    except (OSError, ValueError, KeyError):
+        extracted = _iter_pages_pypdf(path) if PDF_BACKEND == "pypdf" else _iter_pages_pymupdf(path)
+        pages = _write_through_pdf_cache(digest, size, extracted)
+    for i, text in enumerate(pages):
         if text.strip():
-            out.append((text, {"source": path.name, "page": i + 1}))
-    return out
+            yield text, {"source": path.name, "page": i + 1}
 
 
-def load_text(path: Path) -> list[tuple[str, dict]]:
-    """Load a plain text file; return list of (content, {source})."""
+def load_text(path: Path) -> Iterator[tuple[str, dict]]:
+    """Load a plain text file; yield (content, {source}) if it is not empty."""
     text = path.read_text(encoding="utf-8", errors="replace")
-    if not text.strip():
-        return []
-    return [(text, {"source": path.name})]
+    if text.strip():
+        yield text, {"source": path.name}
 
 
-def load_document(path: Path) -> list[tuple[str, dict]]:
-    """Load one document (PDF or .txt); return list of (text, metadata)."""
+def load_document(path: Path) -> Iterator[tuple[str, dict]]:
+    """Load one document (PDF or .txt); yield (text, metadata) pieces as they are read."""
     path = Path(path)
     if not path.exists():
-        return []
+        return iter(())
     suf = path.suffix.lower()
     if suf == ".pdf":
         return load_pdf(path)
     if suf in (".txt", ".md", ".text"):
         return load_text(path)
-    return []
+    return iter(())
 
 
+@functools.lru_cache(maxsize=1)
 def get_chroma_client_and_collection():
-    """Return ChromaDB persistent client and the docs collection (with Ollama embeddings)."""
+    """
+    Return ChromaDB persistent client and the docs collection.
+    Cached per process so SQLite and the index are opened once, not on every call.
+    """
     CHROMA_PATH.mkdir(parents=True, exist_ok=True)
     client = chromadb.PersistentClient(path=str(CHROMA_PATH))
-    ef = OllamaEmbeddingFunction(
-        model_name=EMBEDDING_MODEL,
-        url=OLLAMA_BASE_URL.rstrip("/") + "/api/embeddings",
-    )
     collection = client.get_or_create_collection(
         name=COLLECTION_NAME,
-        embedding_function=ef,
+        # Embeddings are always passed explicitly; None also opens indexes persisted with a
+        # different embedding function config (e.g. chromadb's built-in Ollama one)
+        embedding_function=None,
         metadata={"description": "localMind document chunks"},
     )
     return client, collection
 
 
+def _chunk_key(chunk: str) -> str:
+    """Content hash of a chunk, used as its ChromaDB id so identical chunks are stored once."""
+    return hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _extract_and_chunk(path: Path, source_name: str | None = None) -> tuple[list[str], list[str], list[dict]]:
+    """
+    Load one document and chunk it page by page; runs in a worker process.
+    source_name overrides the metadata source (e.g. upload name).
+    Returns (ids, chunks, metadatas); ids are chunk content keys.
+    """
+    ids: list[str] = []
+    chunks: list[str] = []
+    metadatas: list[dict] = []
+    for text, meta in load_document(path):
+        if source_name:
+            meta = {**meta, "source": source_name}
+        for chunk in _chunk_text(text):
+            ids.append(_chunk_key(chunk))
+            chunks.append(chunk)
+            metadatas.append(meta)
+    return ids, chunks, metadatas
+
+
+def _extract_all(
+    jobs: list[tuple[Path, str | None]],
+) -> Iterator[tuple[list[str], list[str], list[dict]] | Exception]:
+    """
+    Run _extract_and_chunk over jobs of (path, source_name), using a process pool when there
+    is more than one file. Yields each job's result (or the exception it raised) in order.
+    Only a few files per worker are in flight, so finished results don't pile up while the
+    consumer waits on embedding; closing the generator cancels files not yet started.
+    """
+    if len(jobs) <= 1:
+        for job in jobs:
+            try:
+                result = _extract_and_chunk(*job)
+            except Exception as e:
+                result = e
+            yield result
+        return
+    workers = min(len(jobs), os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT)
+    todo = iter(jobs)
+    in_flight: deque[Future] = deque()
+    try:
+        for job in itertools.islice(todo, _JOBS_PER_WORKER * workers):
+            in_flight.append(pool.submit(_extract_and_chunk, *job))
+        while in_flight:
+            try:
+                result = in_flight.popleft().result()
+            except Exception as e:
+                result = e
+            job = next(todo, None)
+            if job is not None:
+                in_flight.append(pool.submit(_extract_and_chunk, *job))
+            yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# Chunk keys known to be in the collection (written or seen by this process), so repeated
+# boilerplate and re-ingested files skip both the existence check and the embedding call
+_indexed_keys: set[str] = set()
+
+
+def _upsert(collection, ids: list[str], documents: list[str], metadatas: list[dict], embeddings: np.ndarray) -> None:
+    """
+    Write one window; embeddings stay a float32 matrix until this point, then become lists for Chroma.
+    Caches are updated as soon as the window is persisted, even if a later window fails.
+    """
+    collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings.tolist())
+    _indexed_keys.update(ids)
+    bump_collection_version()
+
+
+def _sources(meta: dict) -> list[str]:
+    """Every document a chunk is cited from: the joined "sources" field, else its single source."""
+    return [s for s in (meta.get("sources") or meta.get("source") or "").split(SOURCES_SEP) if s]
+
+
+def _with_sources(meta: dict, sources: Iterable[str]) -> dict:
+    """Metadata with sources appended to its "sources" field; the same dict if none are new."""
+    cited = _sources(meta)
+    new = [s for s in dict.fromkeys(sources) if s not in cited]
+    if not new:
+        return meta
+    return {**meta, "sources": SOURCES_SEP.join(cited + new)}
+
+
+def _merge_sources(collection, late: dict[str, set[str]]) -> None:
+    """Add sources found after a shared chunk was stored (a later file, or an earlier run) to its metadata."""
+    stored = collection.get(ids=list(late), include=["metadatas"])
+    ids, metadatas = [], []
+    for key, meta in zip(stored["ids"], stored["metadatas"]):
+        meta = meta or {}
+        merged = _with_sources(meta, late[key])
+        if merged is not meta:
+            ids.append(key)
+            metadatas.append(merged)
+    if ids:
+        collection.update(ids=ids, metadatas=metadatas)
+        bump_collection_version()
+    late.clear()
+
+
+def _drop_legacy_rows(collection, sources: list[str]) -> None:
+    """
+    Delete rows of re-ingested sources stored under ids from before content keys (f"{stem}_{n}",
+    uploads f"{stem}_{n}_{obj id}"; content keys are hex, with no underscore), so re-ingesting
+    into an older index does not return every passage twice.
+    """
+    for i in range(0, len(sources), ADD_BATCH):
+        ids = collection.get(where={"source": {"$in": sources[i : i + ADD_BATCH]}}, include=[])["ids"]
+        legacy = [key for key in ids if "_" in key]
+        if legacy:
+            collection.delete(ids=legacy)
+            bump_collection_version()
+
+
+def _index_chunks(collection, records: Iterable[tuple[str, str, dict]]) -> int:
+    """
+    Deduplicate (key, chunk, metadata) records by content key and write them in windows of
+    ADD_BATCH: each window is embedded, then upserted on a writer thread while the next window
+    is embedded. Memory stays bounded and every finished window is persisted.
+    A chunk repeated across files is embedded once and keeps the metadata of its first
+    occurrence, with every file it appears in joined into a "sources" field.
+    Returns the number of unique chunks.
+    """
+    seen: set[str] = set()
+    window: dict[str, tuple[str, dict]] = {}
+    # Sources of repeated chunks that are already stored, merged into their metadata in batches
+    late: dict[str, set[str]] = {}
+    pending: Future | None = None
+
+    def finish_pending() -> None:
+        nonlocal pending
+        if pending is not None:
+            future, pending = pending, None
+            future.result()
+
+    def flush(writer: ThreadPoolExecutor) -> None:
+        nonlocal pending
+        keys = list(window)
+        # Chunks stored by an earlier run are already embedded
+        existing = set(collection.get(ids=keys, include=[])["ids"])
+        _indexed_keys.update(existing)
+        for k in existing:
+            late.setdefault(k, set()).update(_sources(window[k][1]))
+        todo = [k for k in keys if k not in existing]
+        if todo:
+            documents = [window[k][0] for k in todo]
+            metadatas = [window[k][1] for k in todo]
+            # Embed ourselves (batched, concurrent) and pass vectors in, so Chroma never calls the
+            # embedding function on add
+            embeddings = embed(documents)
+            finish_pending()
+            pending = writer.submit(_upsert, collection, todo, documents, metadatas, embeddings)
+        window.clear()
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for key, chunk, meta in records:
+            if key in window:
+                window[key] = (chunk, _with_sources(window[key][1], _sources(meta)))
+                continue
+            if key in seen or key in _indexed_keys:
+                late.setdefault(key, set()).update(_sources(meta))
+                if len(late) >= ADD_BATCH:
+                    finish_pending()
+                    _merge_sources(collection, late)
+            else:
+                window[key] = (chunk, meta)
+                if len(window) >= ADD_BATCH:
+                    flush(writer)
+            seen.add(key)
+        if window:
+            flush(writer)
+        finish_pending()
+        if late:
+            _merge_sources(collection, late)
+    return len(seen)
+
+
 def ingest_paths(paths: list[Path]) -> tuple[int, list[str]]:
     """
     Ingest a list of file/folder paths into ChromaDB.
-    Returns (number of chunks added, list of error messages).
+    Returns (number of unique chunks indexed, list of error messages).
     """
     client, collection = get_chroma_client_and_collection()
     errors = []
-    all_ids: list[str] = []
-    all_chunks: list[str] = []
-    all_metadatas: list[dict] = []
-
-    def add_file(file_path: Path) -> None:
-        nonlocal all_ids, all_chunks, all_metadatas
-        items = load_document(file_path)
-        if not items:
-            if file_path.suffix.lower() in (".pdf", ".txt", ".md"):
-                errors.append(f"Empty or unreadable: {file_path}")
-            return
-        base_name = file_path.stem
-        idx = 0
-        for text, meta in items:
-            for chunk in _chunk_text(text):
-                doc_id = f"{base_name}_{idx}"
-                all_ids.append(doc_id)
-                all_chunks.append(chunk)
-                all_metadatas.append(meta)
-                idx += 1
-
+    sources: list[str] = []
+    file_paths: list[Path] = []
     for p in paths:
         p = Path(p).resolve()
         if not p.exists():
             errors.append(f"Not found: {p}")
             continue
         if p.is_file():
-            add_file(p)
+            file_paths.append(p)
         else:
             for f in p.rglob("*"):
                 if f.is_file() and f.suffix.lower() in (".pdf", ".txt", ".md", ".text"):
-                    add_file(f)
+                    file_paths.append(f)
 
-    if not all_chunks:
-        return 0, errors
+    extracted = _extract_all([(f, None) for f in file_paths])
 
-    # ChromaDB expects no embedding_fn when adding with precomputed; we use the collection's
-    # embedding function by adding documents (collection will call the embedding function).
-    collection.add(ids=all_ids, documents=all_chunks, metadatas=all_metadatas)
-    return len(all_ids), errors
+    def records() -> Iterator[tuple[str, str, dict]]:
+        for file_path, result in zip(file_paths, extracted):
+            if isinstance(result, Exception):
+                errors.append(f"{file_path}: {result}")
+                continue
+            ids, chunks, metadatas = result
+            if not chunks:
+                if file_path.suffix.lower() in (".pdf", ".txt", ".md"):
+                    errors.append(f"Empty or unreadable: {file_path}")
+                continue
+            sources.append(metadatas[0]["source"])
+            yield from zip(ids, chunks, metadatas)
+
+    # closing() stops extraction right away if embedding or writing fails
+    with closing(extracted):
+        count = _index_chunks(collection, records())
+    _drop_legacy_rows(collection, list(dict.fromkeys(sources)))
+    return count, errors
 
 
 def ingest_files_in_memory(file_contents: list[tuple[str, bytes, str]], filenames: list[str]) -> tuple[int, list[str]]:
@@ -148,42 +457,39 @@ def ingest_files_in_memory(file_contents: list[tuple[str, bytes, str]], filename
     Ingest files from in-memory content (e.g. Streamlit uploads).
     file_contents: list of (filename, raw_bytes, inferred_extension).
     filenames: display names for metadata.
-    Returns (chunks added, errors).
+    Returns (unique chunks indexed, errors).
     """
     import tempfile
     client, collection = get_chroma_client_and_collection()
     errors = []
-    all_ids: list[str] = []
-    all_chunks: list[str] = []
-    all_metadatas: list[dict] = []
-
-    for (name, raw, ext), display_name in zip(file_contents, filenames):
-        with tempfile.NamedTemporaryFile(suffix=ext or ".txt", delete=False) as tmp:
-            tmp.write(raw)
-            tmp.flush()
-            tmp_path = Path(tmp.name)
-        try:
-            items = load_document(tmp_path)
-        except Exception as e:
-            errors.append(f"{display_name}: {e}")
+    sources: list[str] = []
+    jobs: list[tuple[Path, str | None]] = []
+
+    def records() -> Iterator[tuple[str, str, dict]]:
+        for (_, display_name), result in zip(jobs, extracted):
+            if isinstance(result, Exception):
+                errors.append(f"{display_name}: {result}")
+                continue
+            ids, chunks, metadatas = result
+            if not chunks:
+                errors.append(f"Empty or unreadable: {display_name}")
+                continue
+            sources.append(display_name)
+            yield from zip(ids, chunks, metadatas)
+
+    try:
+        # Workers read uploads from temp files; they are removed once extraction is done
+        for (name, raw, ext), display_name in zip(file_contents, filenames):
+            with tempfile.NamedTemporaryFile(suffix=ext or ".txt", delete=False) as tmp:
+                tmp.write(raw)
+                tmp.flush()
+                jobs.append((Path(tmp.name), display_name))
+        extracted = _extract_all(jobs)
+        # closing() stops extraction right away if embedding or writing fails
+        with closing(extracted):
+            count = _index_chunks(collection, records())
+        _drop_legacy_rows(collection, list(dict.fromkeys(sources)))
+        return count, errors
+    finally:
+        for tmp_path, _ in jobs:
             tmp_path.unlink(missing_ok=True)
-            continue
-        tmp_path.unlink(missing_ok=True)
-        if not items:
-            errors.append(f"Empty or unreadable: {display_name}")
-            continue
-        base_name = Path(display_name).stem
-        idx = 0
-        for text, meta in items:
-            # override source to uploaded name
-            meta = {**meta, "source": display_name}
-            for chunk in _chunk_text(text):
-                doc_id = f"{base_name}_{idx}_{id(raw)}"
-                all_ids.append(doc_id)
-                all_chunks.append(chunk)
-                all_metadatas.append(meta)
-                idx += 1
-    if not all_chunks:
-        return 0, errors
-    collection.add(ids=all_ids, documents=all_chunks, metadatas=all_metadatas)
-    return len(all_chunks), errors
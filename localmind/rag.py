@@ -1,50 +1,100 @@
 """RAG query: embed question, retrieve from ChromaDB, generate answer via Ollama."""
+import asyncio
+import functools
+from collections.abc import AsyncIterator
+
 import ollama
-from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
 
 from localmind.config import (
+    CHAT_MODEL,
     CHROMA_PATH,
     COLLECTION_NAME,
-    EMBEDDING_MODEL,
-    CHAT_MODEL,
     OLLAMA_BASE_URL,
     TOP_K,
 )
+from localmind.embeddings import embed
 
 
+@functools.lru_cache(maxsize=1)
 def _get_collection():
-    """Get ChromaDB collection with Ollama embedding function."""
+    """Get the ChromaDB docs collection (cached per process)."""
     import chromadb
     CHROMA_PATH.mkdir(parents=True, exist_ok=True)
     client = chromadb.PersistentClient(path=str(CHROMA_PATH))
-    ef = OllamaEmbeddingFunction(
-        model_name=EMBEDDING_MODEL,
-        url=OLLAMA_BASE_URL.rstrip("/") + "/api/embeddings",
-    )
     return client.get_or_create_collection(
         name=COLLECTION_NAME,
-        embedding_function=ef,
+        # Embeddings are always passed explicitly; None also opens indexes persisted with a
+        # different embedding function config (e.g. chromadb's built-in Ollama one)
+        embedding_function=None,
         metadata={"description": "localMind document chunks"},
     )
 
 
+@functools.lru_cache(maxsize=1)
+def get_chat_client() -> ollama.Client:
+    """Shared Ollama client so chat requests reuse one warm connection pool."""
+    return ollama.Client(host=OLLAMA_BASE_URL)
+
+
+# Incremented after every write to the collection; part of the retrieve() cache key
+_collection_version = 0
+
+
+def bump_collection_version() -> None:
+    """Invalidate cached retrievals after the collection changed (called by ingest)."""
+    global _collection_version
+    _collection_version += 1
+
+
 def retrieve(question: str, top_k: int = TOP_K) -> list[tuple[str, dict, float]]:
     """
     Embed the question and return top-k similar chunks from ChromaDB.
-    Returns list of (document_text, metadata, distance).
+    Returns list of (document_text, metadata, distance). Results are cached until the next ingest
+    in this process.
     """
+    return list(_retrieve_cached(question, top_k, _collection_version))
+
+
+@functools.lru_cache(maxsize=256)
+def _embed_question(question: str) -> tuple[float, ...]:
+    """Query vector via the batched /api/embed path; kept across ingests since it does not depend on the index."""
+    return tuple(embed([question])[0].tolist())
+
+
+@functools.lru_cache(maxsize=256)
+def _retrieve_cached(question: str, top_k: int, version: int) -> tuple[tuple[str, dict, float], ...]:
+    """Uncached retrieval; version only keys the cache so results from before an ingest are dropped."""
     collection = _get_collection()
-    if collection.count() == 0:
-        return []
+    # Pass our own vector so Chroma does not call the embedding function per query. No count()
+    # round-trip: query returns fewer (or no) results when the collection is smaller than top_k.
     results = collection.query(
-        query_texts=[question],
-        n_results=min(top_k, collection.count()),
+        query_embeddings=[list(_embed_question(question))],
+        n_results=top_k,
         include=["documents", "metadatas", "distances"],
     )
     docs = results["documents"][0] or []
     metas = results["metadatas"][0] or []
     dists = results["distances"][0] if results.get("distances") else [0.0] * len(docs)
-    return list(zip(docs, metas, dists))
+    return tuple(zip(docs, metas, dists))
+
+
+# Joins the "sources" metadata of a chunk that several documents share (see ingest._index_chunks)
+SOURCES_SEP = "; "
+
+
+def other_sources(meta: dict) -> list[str]:
+    """Documents that also contain this chunk, besides its first source."""
+    return [s for s in (meta.get("sources") or "").split(SOURCES_SEP) if s and s != meta.get("source")]
+
+
+def _citation(meta: dict) -> str:
+    """Source, page and any other documents sharing the chunk, for the prompt's context headers."""
+    also = other_sources(meta)
+    return (
+        meta.get("source", "unknown")
+        + (f", page {meta.get('page')}" if meta.get("page") else "")
+        + (f"; also in {', '.join(also)}" if also else "")
+    )
 
 
 def build_prompt(question: str, chunks: list[tuple[str, dict, float]]) -> str:
@@ -55,7 +105,7 @@ def build_prompt(question: str, chunks: list[tuple[str, dict, float]]) -> str:
             "and say you have no document context.\n\nQuestion: " + question
         )
     context = "\n\n---\n\n".join(
-        f"[Source: {m.get('source', 'unknown')}" + (f", page {m.get('page')}" if m.get("page") else "") + "]\n" + text
+        f"[Source: {_citation(m)}]\n" + text
         for text, m, _ in chunks
     )
     return (
@@ -65,19 +115,64 @@ def build_prompt(question: str, chunks: list[tuple[str, dict, float]]) -> str:
     )
 
 
-def ask(question: str, top_k: int = TOP_K, stream: bool = False):
+def ask(question: str, top_k: int = TOP_K, stream: bool = False, client: ollama.Client | None = None):
     """
     Run RAG: retrieve chunks, build prompt, call Ollama chat.
     If stream=True, yields response chunks; else returns full response and sources.
+    client defaults to the shared get_chat_client().
     """
     chunks = retrieve(question, top_k=top_k)
     prompt = build_prompt(question, chunks)
-    client = ollama.Client(host=OLLAMA_BASE_URL)
+    client = client or get_chat_client()
 
     if stream:
         stream_gen = client.chat(model=CHAT_MODEL, messages=[{"role": "user", "content": prompt}], stream=True)
         return stream_gen, chunks
     response = client.chat(model=CHAT_MODEL, messages=[{"role": "user", "content": prompt}])
+    return _message_content(response), chunks
+
+
+def _message_content(response) -> str:
+    """Message text from an Ollama chat response or stream part (dict or response object)."""
     message = getattr(response, "message", response) if not isinstance(response, dict) else response.get("message") or {}
-    answer = getattr(message, "content", None) or (message.get("content") if isinstance(message, dict) else "") or ""
-    return answer, chunks
+    return getattr(message, "content", None) or (message.get("content") if isinstance(message, dict) else "") or ""
+
+
+async def _warm_up(client: ollama.AsyncClient) -> None:
+    """Load the chat model (a chat request without messages only loads it); failures surface on the real call."""
+    try:
+        await client.chat(model=CHAT_MODEL, messages=[])
+    except Exception:
+        pass
+
+
+async def aask(
+    question: str, top_k: int = TOP_K, client: ollama.AsyncClient | None = None
+) -> tuple[AsyncIterator[str], list[tuple[str, dict, float]]]:
+    """
+    Async streaming RAG. Retrieval runs in a thread while the chat model is loaded, then the
+    answer is streamed with non-blocking HTTP.
+    client: a long-lived AsyncClient, always used from the same event loop, to keep connections
+    warm across calls; if omitted, one is created for this call and closed when the stream ends.
+    Returns (async iterator of answer text pieces, sources).
+    """
+    owned = client is None
+    client = client or ollama.AsyncClient(host=OLLAMA_BASE_URL)
+    try:
+        chunks, _ = await asyncio.gather(asyncio.to_thread(retrieve, question, top_k), _warm_up(client))
+        prompt = build_prompt(question, chunks)
+        stream = await client.chat(model=CHAT_MODEL, messages=[{"role": "user", "content": prompt}], stream=True)
+    except BaseException:
+        if owned:
+            await client.close()
+        raise
+
+    async def pieces() -> AsyncIterator[str]:
+        try:
+            async for part in stream:
+                yield _message_content(part)
+        finally:
+            if owned:
+                await client.close()
+
+    return pieces(), chunks
@@ -1,14 +1,76 @@
 """Streamlit UI for localMind: upload documents, embed, and chat with RAG."""
+import asyncio
 import sys
+import threading
 from pathlib import Path
 
 # Ensure project root is on path
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
+import ollama
 import streamlit as st
 
-from localmind.ingest import get_chroma_client_and_collection, ingest_paths, ingest_files_in_memory
-from localmind.rag import ask
+from localmind.config import OLLAMA_BASE_URL
+from localmind.ingest import (
+    get_chroma_client_and_collection,
+    ingest_files_in_memory,
+    ingest_paths,
+)
+from localmind.rag import aask, other_sources
+
+
+@st.cache_resource
+def _chroma():
+    """One ChromaDB client/collection shared across reruns and sessions."""
+    return get_chroma_client_and_collection()
+
+
+def _source_previews(sources) -> list[tuple[str, str]]:
+    """(label, text preview) per retrieved chunk; computed once when the answer is added to history."""
+    previews = []
+    for (text, meta, _) in sources:
+        src = meta.get("source", "?")
+        page = meta.get("page")
+        also = other_sources(meta)
+        label = f"{src}" + (f" (page {page})" if page else "") + (f" — also in {', '.join(also)}" if also else "")
+        previews.append((label, text[:300] + ("..." if len(text) > 300 else "")))
+    return previews
+
+
+def _render_sources(previews: list[tuple[str, str]]) -> None:
+    with st.expander("Sources"):
+        for label, preview in previews:
+            st.caption(label)
+            st.text(preview)
+
+
+@st.cache_resource
+def _chat_runtime() -> tuple[asyncio.AbstractEventLoop, ollama.AsyncClient]:
+    """
+    One event loop (on a background thread, so concurrent sessions can share it) and one
+    AsyncClient bound to it, reused by every chat turn so connections stay warm.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="localmind-chat", daemon=True).start()
+    return loop, ollama.AsyncClient(host=OLLAMA_BASE_URL)
+
+
+def _run(loop: asyncio.AbstractEventLoop, coro):
+    """Run a coroutine on the chat loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def _next_piece(pieces):
+    return await pieces.__anext__()
+
+
+def _sync_stream(loop: asyncio.AbstractEventLoop, pieces):
+    """Drive an async iterator on loop so st.write_stream can consume it."""
+    while True:
+        try:
+            yield _run(loop, _next_piece(pieces))
+        except StopAsyncIteration:
+            return
 
 
 def main():
@@ -65,13 +127,14 @@ def main():
                     st.error(e)
 
         st.divider()
-        # Show collection count if available
-        try:
-            _, col = get_chroma_client_and_collection()
-            count = col.count()
-            st.metric("Chunks in index", count)
-        except Exception:
-            st.metric("Chunks in index", 0)
+        # Show collection count if available; counted once per session and after each ingest
+        if st.session_state.get("chunk_count") is None or embed_clicked:
+            try:
+                _, col = _chroma()
+                st.session_state.chunk_count = col.count()
+            except Exception:
+                st.session_state.chunk_count = None
+        st.metric("Chunks in index", st.session_state.chunk_count or 0)
 
     # Main: chat
     if "messages" not in st.session_state:
@@ -80,45 +143,41 @@ def main():
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
-            if msg.get("sources"):
-                with st.expander("Sources"):
-                    for (text, meta, _) in msg["sources"]:
-                        src = meta.get("source", "?")
-                        page = meta.get("page")
-                        label = f"{src}" + (f" (page {page})" if page else "")
-                        st.caption(label)
-                        st.text(text[:300] + ("..." if len(text) > 300 else ""))
+            if msg.get("previews"):
+                _render_sources(msg["previews"])
 
     if prompt := st.chat_input("Ask about your documents..."):
-        st.session_state.messages.append({"role": "user", "content": prompt, "sources": None})
+        st.session_state.messages.append({"role": "user", "content": prompt, "previews": None})
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    answer, sources = ask(prompt)
-                    st.markdown(answer)
-                    if sources:
-                        with st.expander("Sources"):
-                            for (text, meta, _) in sources:
-                                src = meta.get("source", "?")
-                                page = meta.get("page")
-                                label = f"{src}" + (f" (page {page})" if page else "")
-                                st.caption(label)
-                                st.text(text[:300] + ("..." if len(text) > 300 else ""))
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": answer,
-                        "sources": sources,
-                    })
-                except Exception as e:
-                    st.error(str(e))
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": f"Error: {e}",
-                        "sources": None,
-                    })
+            loop, client = _chat_runtime()
+            stream = None
+            try:
+                with st.spinner("Thinking..."):
+                    stream, sources = _run(loop, aask(prompt, client=client))
+                # Tokens render as they arrive instead of after the whole answer
+                answer = st.write_stream(_sync_stream(loop, stream))
+                previews = _source_previews(sources)
+                if previews:
+                    _render_sources(previews)
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": answer,
+                    "previews": previews,
+                })
+            except Exception as e:
+                st.error(str(e))
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"Error: {e}",
+                    "previews": None,
+                })
+            finally:
+                # Release the HTTP response if the stream was not read to the end
+                if stream is not None:
+                    _run(loop, stream.aclose())
 
 
 if __name__ == "__main__":